@@ -74,6 +74,8 @@ read_benchmark(const char *filename)
 			benchmark->all_text = true;
 		} else if (0 == strcmp(keyword, "EXPECTED") && has_value) {
 			benchmark->expected = value;
+		} else if (0 == strcmp(keyword, "BYTES") && has_value) {
+			// only used by bench.py
 		} else {
 			fprintf(stderr, "Invalid keyword %s\n", keyword);
 			exit(1);
@@ -1,5 +1,10 @@
+// for pthread_setaffinity_np
+#define _GNU_SOURCE
+
 #include "runner.h"
 
+#include <errno.h>
+#include <sched.h>
 #include <stdlib.h>
 #include <string.h>
 
@@ -18,6 +23,7 @@ struct {
 struct worker {
 	Mapi conn;
 	MapiHdl handle;
+	int cpu;
 };
 
 void
@@ -89,6 +95,7 @@ pick_handler(struct benchmark *benchmark, const char *type_name)
 		{ "char", text_handler },
 		{ "varchar", text_handler },
 		{ "clob", text_handler },
+		{ "blob", text_handler },
 	};
 
 	for (int i = 0; i < sizeof(mapping) / sizeof(mapping[0]); i++) {
@@ -160,12 +167,58 @@ execute_query(struct worker *worker)
 	return worker->handle;
 }
 
+// Set by bench.py --pin-workers, for example "2,3,4,5".
+// Worker i is pinned to the i'th cpu in the list, round robin.
+// Returns -1 if the workers should not be pinned.
+static int
+worker_cpu(int i)
+{
+	const char *cpus = getenv("BENCH_WORKER_CPUS");
+	if (cpus == NULL || *cpus == '\0')
+		return -1;
+
+	int n = 1;
+	for (const char *p = cpus; *p; p++) {
+		if (*p == ',')
+			n++;
+	}
+
+	const char *pos = cpus;
+	for (int skip = i % n; skip > 0; skip--)
+		pos = strchr(pos, ',') + 1;
+
+	char *end;
+	long cpu = strtol(pos, &end, 10);
+	if (end == pos || (*end != ',' && *end != '\0')) {
+		fprintf(stderr, "Invalid BENCH_WORKER_CPUS: '%s'\n", cpus);
+		exit(1);
+	}
+	return cpu;
+}
+
+static void
+pin_worker(struct worker *worker)
+{
+	if (worker->cpu < 0)
+		return;
+	cpu_set_t set;
+	CPU_ZERO(&set);
+	CPU_SET(worker->cpu, &set);
+	int err = pthread_setaffinity_np(pthread_self(), sizeof(set), &set);
+	if (err != 0) {
+		errno = err;
+		die_errno("pin worker to cpu");
+	}
+}
+
 static void *
 run_worker(void *arg)
 {
 	struct worker *worker = arg;
 	struct buffer *output_buffer = NULL;
 
+	pin_worker(worker);
+
 	long now;
 	do {
 		if (common.benchmark->reconnect)
@@ -206,6 +259,7 @@ run_executors(double duration)
 			die_errno("alloc worker");
 		worker->conn = NULL;
 		worker->handle = NULL;
+		worker->cpu = worker_cpu(i);
 
 		if (0 != pthread_create(&threads[i], NULL, run_worker, worker))
 			die_errno("start worker");
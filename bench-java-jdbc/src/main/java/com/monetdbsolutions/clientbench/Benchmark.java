@@ -68,6 +68,12 @@ public class Benchmark {
 						throw new RuntimeException("Invalid keyword in sql query, need @HITCOUNT=number@");
 					}
 					break;
+				case "BYTES":
+					// only used by bench.py
+					if (value == null) {
+						throw new RuntimeException("Invalid keyword in sql query, need @BYTES=number@");
+					}
+					break;
 				default:
 					throw new RuntimeException("Invalid keyword in sql query: " + name);
 			}
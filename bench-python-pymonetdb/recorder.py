@@ -0,0 +1,120 @@
+# Low overhead recording of timestamps.
+#
+# Worker threads store their timestamps in preallocated arrays of machine
+# integers. Full arrays are handed to a background thread which formats and
+# writes them, and then returns them for reuse. The number of arrays in
+# flight is bounded so memory use does not grow with the duration of the run.
+# This is the same design as ResultWriter in the JDBC runner and output.c in
+# the libmapi runner.
+
+from array import array
+from queue import Queue
+import sys
+from threading import Lock, Thread
+import time
+from typing import Optional, TextIO, Tuple
+
+CHUNK_SIZE = 8192
+MAX_CHUNKS = 64
+
+
+class ResultWriter:
+    def __init__(self, out: TextIO = sys.stdout, lock: Optional[Lock] = None,
+                 chunk_size: int = CHUNK_SIZE, max_chunks: int = MAX_CHUNKS):
+        self.out = out
+        self.lock = lock or Lock()
+        self.chunk_size = chunk_size
+        # The full queue holds (chunk, n) pairs, a chunk of None means shut
+        # down. Blocking on the free queue is what bounds the memory usage.
+        self.full: Queue = Queue()
+        self.free: Queue = Queue()
+        for _ in range(max_chunks):
+            self.free.put(self._new_chunk())
+        self.worker = Thread(target=self._work, daemon=True)
+        self.worker.start()
+
+    def _new_chunk(self) -> array:
+        return array('q', bytes(8 * self.chunk_size))
+
+    def new_submitter(self) -> 'Submitter':
+        # every submitter brings its own chunk so they can never starve each other
+        self.free.put(self._new_chunk())
+        return Submitter(self)
+
+    def _take_free(self) -> array:
+        return self.free.get()
+
+    def _submit(self, chunk: array, n: int):
+        self.full.put((chunk, n))
+
+    def _work(self):
+        while True:
+            chunk, n = self.full.get()
+            if chunk is None:
+                break
+            text = '\n'.join(map(str, chunk[:n]))
+            with self.lock:
+                self.out.write(text)
+                self.out.write('\n')
+            self.free.put(chunk)
+        with self.lock:
+            self.out.flush()
+
+    def close(self):
+        self.full.put((None, 0))
+        self.worker.join()
+
+
+class Submitter:
+    """Per-thread handle on a ResultWriter, not thread safe itself"""
+
+    def __init__(self, writer: ResultWriter):
+        self.writer = writer
+        self.chunk = writer._take_free()
+        self.size = len(self.chunk)
+        self.n = 0
+
+    def submit(self, nanos: int):
+        self.chunk[self.n] = nanos
+        self.n += 1
+        if self.n == self.size:
+            self.flush()
+
+    def flush(self):
+        if self.n == 0:
+            return
+        self.writer._submit(self.chunk, self.n)
+        self.chunk = self.writer._take_free()
+        self.n = 0
+
+    def close(self):
+        if self.n > 0:
+            self.writer._submit(self.chunk, self.n)
+        else:
+            self.writer.free.put(self.chunk)
+        self.chunk = None
+        self.n = 0
+
+
+class NullOutput:
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+def measure_overhead(iterations: int = 200_000) -> Tuple[float, float]:
+    """Return the clock resolution and the cost per sample of taking a
+    timestamp and submitting it, both in nanoseconds"""
+    resolution = time.get_clock_info('perf_counter').resolution * 1e9
+    writer = ResultWriter(NullOutput())
+    submitter = writer.new_submitter()
+    clock = time.perf_counter_ns
+    t0 = clock()
+    for _ in range(iterations):
+        submitter.submit(clock() - t0)
+    t1 = clock()
+    submitter.close()
+    writer.close()
+    return resolution, (t1 - t0) / iterations
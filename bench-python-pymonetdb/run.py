@@ -2,10 +2,10 @@
 
 import argparse
 from datetime import date, timedelta
-import io
+import os
 import re
 import sys
-from threading import Lock, Thread
+from threading import Lock, Thread, get_native_id
 import time
 import traceback
 from typing import Optional, Union
@@ -13,10 +13,15 @@ from uuid import UUID
 import pymonetdb
 from pymonetdb import types
 
+from recorder import ResultWriter, measure_overhead
+
 ERROR_COUNT = 0
 
 WRITE_LOCK = Lock()
 
+# Set by bench.py --pin-workers, for example '2,3,4,5'
+WORKER_CPUS_VARIABLE = 'BENCH_WORKER_CPUS'
+
 
 def connect_to(db_url):
     conn = pymonetdb.connect(db_url, autocommit=True)
@@ -32,6 +37,9 @@ def show_info(dburl, fetch_mode):
     print("Python version:", sys.version)
     print("pymonetdb version:", pymonetdb.__version__)
     print("pymonetdb path:", pymonetdb.__path__)
+    resolution, overhead = measure_overhead()
+    print(f"Clock resolution nanos: {resolution:.0f}")
+    print(f"Recorder overhead nanos per sample: {overhead:.0f}")
     cursor = None
     if dburl:
         conn = connect_to(dburl)
@@ -89,6 +97,9 @@ class Benchmark:
                 self.null_count = int(value)
             elif name == "HITCOUNT":
                 self.hit_count = int(value)
+            elif name == "BYTES":
+                # only used by bench.py
+                pass
             else:
                 raise Exception(f"Invalid keyword {m.group(0)}")
 
@@ -241,30 +252,40 @@ def run_benchmark(db_url: str, benchmark: Benchmark, duration: Optional[float]):
         # cannot run this correctly
         return
 
+    worker_cpus = [int(c) for c in os.environ.get(WORKER_CPUS_VARIABLE, '').split(',') if c]
+
+    writer = ResultWriter(sys.stdout, WRITE_LOCK)
     threads = []
     for i in range(benchmark.parallel):
-        thread = start_worker(db_url, benchmark, processor.clone(), duration)
+        cpu = worker_cpus[i % len(worker_cpus)] if worker_cpus else None
+        thread = start_worker(db_url, benchmark, processor.clone(), duration, writer, cpu)
         threads.append(thread)
     for thread in threads:
         thread.join()
+    writer.close()
 
 
-def start_worker(db_url, benchmark, processor, duration):
+def start_worker(db_url, benchmark, processor, duration, writer, cpu=None):
     t = Thread(
         daemon=True,
-        target=lambda: run_queries(db_url, benchmark, processor, duration))
+        target=lambda: run_queries(db_url, benchmark, processor, duration, writer, cpu))
     t.start()
     return t
 
 
-def run_queries(db_url, benchmark: Benchmark, processor: ResultProcessor, duration):
+def run_queries(db_url, benchmark: Benchmark, processor: ResultProcessor, duration,
+                writer: ResultWriter, cpu=None):
     text = benchmark.text
-    out = io.StringIO()
+    submitter = writer.new_submitter()
+    clock = time.perf_counter_ns
     try:
+        if cpu is not None:
+            # on Linux, the affinity of a thread can be set through its native id
+            os.sched_setaffinity(get_native_id(), {cpu})
         conn = None
         cursor = None
-        t0 = time.time()
-        deadline = t0 + duration
+        t0 = clock()
+        deadline = t0 + int(1e9 * duration)
         while True:
             if benchmark.reconnect and cursor:
                 cursor.close()
@@ -277,9 +298,8 @@ def run_queries(db_url, benchmark: Benchmark, processor: ResultProcessor, durati
             processor.clear()
             cursor.execute(text)
             processor.process(cursor)
-            t1 = time.time()
-            elapsed = int(1e9 * (t1 - t0))
-            print(elapsed, file=out)
+            t1 = clock()
+            submitter.submit(t1 - t0)
             if t1 >= deadline:
                 break
 
@@ -292,8 +312,7 @@ def run_queries(db_url, benchmark: Benchmark, processor: ResultProcessor, durati
             ERROR_COUNT += 1
         sys.exit(1)
     finally:
-        with WRITE_LOCK:
-            print(out.getvalue(), flush=True, end='')
+        submitter.close()
 
 
 argparser = argparse.ArgumentParser()
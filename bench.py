@@ -5,15 +5,21 @@
 
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import redirect_stdout
+import csv
 import difflib
-from glob import glob
+import filecmp
+from functools import partial
+from glob import glob, escape as glob_escape
+import hashlib
 import io
 import numpy
 import os
 from os.path import join
 import re
 import shlex
+import shutil
 import subprocess
 import sys
 import time
@@ -21,10 +27,17 @@ from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
 
 import pymonetdb
 
+import history
+import hostenv
+
 BENCHMARK_VERSION = "0.2.0"
 
 HERE = os.path.dirname(sys.argv[0]) or "."
 
+# Lines of runner metadata that are measurements rather than configuration.
+# They are appended with the host description instead of being compared.
+VOLATILE_METADATA = ('Recorder overhead',)
+
 
 # This class is a work in progress.
 class DBSpec:
@@ -136,20 +149,36 @@ def runner_name(s):
 
 
 argparser = argparse.ArgumentParser()
-argparser.add_argument('-d', '--database', required=True,
-                       help='Database name, can also be specified as a MAPI- or JDBC URL')
+argparser.add_argument('-d', '--database', required=True, action='append',
+                       help='Database name, can also be specified as a MAPI- or JDBC URL. '
+                       'Can be given multiple times to benchmark several databases')
+argparser.add_argument('-j', '--max-targets', type=int,
+                       help='With multiple databases, how many to benchmark at the same time. Default all')
 argparser.add_argument('-o', '--output-dir', required=True)
 argparser.add_argument('-r', '--runner', required=True, type=runner_name,
                        choices=KNOWN_RUNNERS.keys(),
                        help='Runner to invoke',)
 argparser.add_argument('--overwrite', action='store_true',
-                       help='Overwrite existing results instead of skipping them')
+                       help='Rerun queries even if up to date results exist')
 argparser.add_argument('--allow-errors', action='store_true',
                        help='Try to continue when a runner fails')
 argparser.add_argument('-t', '--duration', type=float, required=True,
                        help='how long to run the runner, in seconds')
 argparser.add_argument("-w", "--wait", type=float, default=0.0,
                       help="number of seconds to wait before running each benchmark")
+argparser.add_argument('--history', default=os.path.join(HERE, history.DEFAULT_HISTORY_FILE),
+                       help='SQLite file to append the results of this run to')
+argparser.add_argument('--no-history', action='store_true',
+                       help='Do not record this run in the history file')
+argparser.add_argument('--cpus', type=hostenv.parse_cpu_list,
+                       help='Pin the runner to these cpus, for example 2-5,8')
+argparser.add_argument('--pin-workers', action='store_true',
+                       help='Also pin each @PARALLEL@ worker to a single cpu from --cpus, if the runner supports it')
+argparser.add_argument('--nice', type=int,
+                       help='Run the runners with this niceness, negative values usually require root')
+argparser.add_argument('--server-time', action='store_true',
+                       help="Use the server's query log to separate server execution time from client overhead. "
+                       "Empties the query log of the database")
 argparser.add_argument('queries', nargs='*')
 
 
@@ -171,22 +200,159 @@ else:
     TOOL_ARGS = []
 args = argparser.parse_args(our_args)
 # print(args)
+if args.pin_workers and not args.cpus:
+    argparser.error('--pin-workers requires --cpus')
+if args.cpus and not hasattr(os, 'sched_setaffinity'):
+    argparser.error('--cpus and --pin-workers are not supported on this platform')
+if args.max_targets is not None and args.max_targets < 1:
+    argparser.error('--max-targets must be at least 1')
+if args.max_targets is not None and len(args.database) < 2:
+    argparser.error('--max-targets requires more than one --database')
 
 queries = args.queries
 if not queries:
     queries = sorted(glob(os.path.join(HERE, 'queries', '[a-z]*.sql')))
 
-spec = DBSpec(args.database)
+
+def target_name(spec: DBSpec):
+    name = f'{spec.hostname}-{spec.port or 50000}-{spec.database}'
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+
+def target_command(database, target_dir):
+    """Command line to benchmark a single database with the same settings"""
+    cmd = [sys.executable, sys.argv[0],
+           '-d', database, '-o', target_dir, '-r', args.runner,
+           '-t', str(args.duration), '-w', str(args.wait),
+           '--history', args.history]
+    if args.overwrite:
+        cmd.append('--overwrite')
+    if args.allow_errors:
+        cmd.append('--allow-errors')
+    if args.no_history:
+        cmd.append('--no-history')
+    if args.cpus:
+        cmd += ['--cpus', hostenv.format_cpu_list(args.cpus)]
+    if args.pin_workers:
+        cmd.append('--pin-workers')
+    if args.nice is not None:
+        cmd.append(f'--nice={args.nice}')
+    if args.server_time:
+        cmd.append('--server-time')
+    cmd += args.queries
+    if TOOL_ARGS:
+        cmd += ['--', *TOOL_ARGS]
+    return cmd
+
+
+def run_target(name, database, target_dir):
+    os.makedirs(target_dir, exist_ok=True)
+    log_file = os.path.join(target_dir, 'bench.log')
+    print(f'TARGET {name} started, logging to {log_file}', flush=True)
+    with open(log_file, 'w') as log:
+        proc = subprocess.run(target_command(database, target_dir),
+                              stdout=log, stderr=subprocess.STDOUT)
+    status = 'finished' if proc.returncode == 0 else f'FAILED with exit code {proc.returncode}'
+    print(f'TARGET {name} {status}', flush=True)
+    return proc.returncode
+
+
+def write_combined_summary(output_dir, names):
+    """Put the mean_seconds of every target side by side"""
+    columns = []
+    means = dict()
+    for name in names:
+        target_dir = os.path.join(output_dir, name)
+        info = dict()
+        metadata_file = os.path.join(target_dir, 'metadata.txt')
+        if os.path.exists(metadata_file):
+            info = history.parse_info(open(metadata_file).read())
+        version = info.get('MonetDB version') or info.get('MonetDB server version') or 'unknown'
+        columns.append(f'{name} ({version})')
+        summary_file = os.path.join(target_dir, 'summary.txt')
+        if not os.path.exists(summary_file):
+            continue
+        with open(summary_file) as f:
+            for row in csv.DictReader(f):
+                means.setdefault(row['name'], dict())[name] = row['mean_seconds']
+
+    with open(os.path.join(output_dir, 'summary.txt'), 'w') as f:
+        print(','.join(f'"{c}"' for c in ['name', *columns]), file=f)
+        for query in sorted(means):
+            values = [means[query].get(name, '') for name in names]
+            print(f'"{query}",' + ','.join(values), file=f)
+
+
+if len(args.database) > 1:
+    targets = dict()
+    for database in args.database:
+        name = target_name(DBSpec(database))
+        if name in targets:
+            argparser.error(f'database {database} given more than once')
+        targets[name] = database
+    max_targets = min(args.max_targets or len(targets), len(targets))
+    if args.cpus and max_targets > 1:
+        print(f'WARNING: --cpus pins all {max_targets} concurrent targets to the same cpus, '
+              'consider -j 1', file=sys.stderr)
+    output_dir = os.path.abspath(args.output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max_targets) as executor:
+        futures = {
+            name: executor.submit(run_target, name, database, os.path.join(output_dir, name))
+            for name, database in targets.items()
+        }
+        failed_targets = [name for name, future in futures.items() if future.result() != 0]
+    write_combined_summary(output_dir, list(targets))
+    if failed_targets:
+        print()
+        print(f"{len(failed_targets)} targets failed: " + ", ".join(failed_targets))
+        sys.exit(1)
+    sys.exit(0)
+
+spec = DBSpec(args.database[0])
 
 runner_dir = os.path.join(HERE, args.runner)
 
+runner_env = dict(os.environ)
+runner_env.pop(hostenv.WORKER_CPUS_VARIABLE, None)
+if args.pin_workers:
+    runner_env[hostenv.WORKER_CPUS_VARIABLE] = hostenv.format_cpu_list(args.cpus)
+runner_preexec = None
+if args.cpus:
+    runner_preexec = partial(hostenv.pin_to, args.cpus)
+
+if args.nice is not None:
+    problem = hostenv.raise_priority(args.nice)
+    if problem:
+        print(f'WARNING: {problem}', file=sys.stderr)
+for warning in hostenv.check_environment(args.cpus):
+    print(f'WARNING: {warning}', file=sys.stderr)
+
+
+def check_output_with_peak_rss(cmd, **kwargs):
+    """Like subprocess.check_output but also return the peak resident set size
+    of the child in bytes, or None if the platform cannot tell us"""
+    if not hasattr(os, 'wait4'):
+        return subprocess.check_output(cmd, **kwargs), None
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, **kwargs) as proc:
+        output = proc.stdout.read()
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output)
+    # Linux reports kilobytes, macOS bytes
+    peak_rss = rusage.ru_maxrss if sys.platform == 'darwin' else 1024 * rusage.ru_maxrss
+    return output, peak_rss
+
 
 def run_runner(additional_args, allow_errors=False):
+    """Return the output of the runner and its peak memory usage"""
     cmd = KNOWN_RUNNERS[args.runner](spec) + [str(a) for a in additional_args] + [*TOOL_ARGS]
     visual = shlex.join(cmd)
     print('    RUNNING', visual)
     try:
-        output = subprocess.check_output(cmd, cwd=runner_dir, encoding='us-ascii')
+        output, peak_rss = check_output_with_peak_rss(
+            cmd, cwd=runner_dir, encoding='us-ascii', env=runner_env, preexec_fn=runner_preexec)
     except FileNotFoundError as e:
         # exiting instead of raising an exception tends to give better error output here
         print()
@@ -194,11 +360,68 @@ def run_runner(additional_args, allow_errors=False):
     except subprocess.CalledProcessError as e:
         if allow_errors:
             print("    FAILED!")
-            return None
+            return None, None
         # exiting instead of raising an exception tends to give better error output here
         print()
         sys.exit(f"{e}")
-    return output
+    return output, peak_rss
+
+
+def normalize_sql(text):
+    """Strip comments and redundant whitespace so query texts can be compared"""
+    text = re.sub(r'--[^\n]*', '', text)
+    return ' '.join(text.split()).rstrip(';').strip()
+
+
+def start_querylog():
+    """Start recording the execution times of all queries on the server"""
+    conn = pymonetdb.connect(spec.for_python(), autocommit=True)
+    cursor = conn.cursor()
+    cursor.execute("CALL sys.querylog_disable()")
+    cursor.execute("CALL sys.querylog_empty()")
+    cursor.execute("CALL sys.querylog_enable()")
+    cursor.close()
+    return conn
+
+
+def finish_querylog(conn, query_text):
+    """Stop recording and return (run, ship) in microseconds for every timed
+    execution of the given query"""
+    cursor = conn.cursor()
+    cursor.execute("CALL sys.querylog_disable()")
+    # The catalog has one row per query text, the calls one row per execution.
+    # Match the text once and only fetch the timings of the executions.
+    cursor.execute("SELECT id, query FROM sys.querylog_catalog")
+    wanted = normalize_sql(query_text)
+    ids = [qid for qid, query in cursor.fetchall() if normalize_sql(query) == wanted]
+    samples = []
+    if ids:
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(
+            f"SELECT run, ship FROM sys.querylog_calls WHERE id IN ({placeholders}) ORDER BY start",
+            ids)
+        samples = cursor.fetchall()
+    cursor.close()
+    # all runners execute the query once as a warmup before they start the clock
+    return samples[1:]
+
+
+def stop_querylog(conn):
+    """Make sure the server stops logging, also when the runner failed"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute("CALL sys.querylog_disable()")
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def content_key(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()[:12]
 
 
 with open(os.path.join(HERE, 'queries', '_setup.sql')) as f:
@@ -222,25 +445,55 @@ if not os.path.isdir(output_dir):
 metadata_file = os.path.join(output_dir, 'metadata.txt')
 metadata = f"""\
 Benchmark version: {BENCHMARK_VERSION}
-Benchmark git revision: {git_rev}
 Duration: {args.duration}
 Additional arguments: {shlex.join(TOOL_ARGS)}
 """
-metadata += run_runner([])
+# Only mention these when used so existing results keep their keys
+if args.cpus:
+    metadata += f"CPU affinity: {hostenv.format_cpu_list(args.cpus)}\n"
+    metadata += f"Pin workers: {'yes' if args.pin_workers else 'no'}\n"
+if args.nice is not None:
+    metadata += f"Requested niceness: {args.nice}\n"
+if args.server_time:
+    # the query log has some overhead of its own
+    metadata += "Server timing: query log\n"
+runner_metadata = run_runner([])[0].splitlines(keepends=True)
+metadata += ''.join(line for line in runner_metadata if not line.startswith(VOLATILE_METADATA))
+measurements = ''.join(line for line in runner_metadata if line.startswith(VOLATILE_METADATA))
 print(metadata)
+
+# Results are stored under a key derived from everything that influences
+# them: the metadata above (which includes the duration, the tool arguments
+# and the runner's version information), the setup code and the query text.
+# Results for other keys are left alone so switching back and forth is cheap.
+metadata_key = content_key(metadata, setup_code)
+keyed_dir = os.path.join(output_dir, 'results', metadata_key)
+os.makedirs(keyed_dir, exist_ok=True)
+keyed_metadata_file = os.path.join(keyed_dir, 'metadata.txt')
 if os.path.exists(metadata_file):
     existing_content = open(metadata_file).read()
-    if metadata not in existing_content:
+    if not existing_content.startswith(metadata):
         metadata_lines = metadata.splitlines()
         existing_lines = existing_content.splitlines()
-        for line in difflib.unified_diff(existing_lines, metadata_lines, metadata_file):
-                print(line.rstrip(), file=sys.stderr)
-        print(f'ERROR: Content of {metadata_file} seems to have changed, see above', file=sys.stderr)
-        sys.exit(1)
-else:
-    with open(metadata_file, 'w') as f:
+        for line in difflib.unified_diff(existing_lines, metadata_lines, metadata_file, lineterm=''):
+            print(line.rstrip())
+        print(f'NOTE: Content of {metadata_file} has changed, see above. Using key {metadata_key}')
+if not os.path.exists(keyed_metadata_file):
+    with open(keyed_metadata_file, 'w') as f:
         f.write(metadata)
 
+shutil.copyfile(keyed_metadata_file, metadata_file)
+
+# The host state differs from run to run so it is kept out of the metadata
+# and the key. So is the git revision, editing a query file makes the
+# checkout dirty and would otherwise invalidate all results. It describes
+# this run only and ends up in the history.
+run_started = time.strftime('%Y-%m-%d %H:%M:%S')
+environment = f"Benchmark git revision: {git_rev}\n" + hostenv.describe_environment(run_started) + measurements
+print(environment)
+with open(os.path.join(output_dir, 'environment.txt'), 'w') as f:
+    f.write(environment)
+
 
 def output_path(query_file, extension):
     base = os.path.splitext(os.path.basename(query_file))[0]
@@ -248,8 +501,47 @@ def output_path(query_file, extension):
     return path
 
 
+def parse_keywords(query_text):
+    """The @KEYWORD=n@ settings in a query file"""
+    return {k: int(v) for k, v in re.findall(r'@([A-Z]+)=([0-9]+)@', query_text)}
+
+
 failures = []
+results = dict()
+# keywords of every query in the summary, by name
+keywords = dict()
 for qf in queries:
+    print('QUERY', os.path.basename(qf))
+
+    # QUERY.csv always holds the result for the current key,
+    # results/METADATA_KEY/QUERY-QUERY_KEY.csv keeps them all.
+    csv_file = output_path(qf, 'csv')
+    with open(qf) as f:
+        query_text = f.read()
+    query_key = content_key(query_text)
+    base = os.path.splitext(os.path.basename(qf))[0]
+    keywords[base] = parse_keywords(query_text)
+    # the query text, so later runs know the keywords of these results
+    keyed_query_file = os.path.join(keyed_dir, f'{base}-{query_key}.sql')
+    if not os.path.exists(keyed_query_file):
+        shutil.copyfile(qf, keyed_query_file)
+    keyed_csv_file = os.path.join(keyed_dir, f'{base}-{query_key}.csv')
+    # peak memory usage of the runner, in bytes
+    rss_file = output_path(qf, 'rss')
+    keyed_rss_file = os.path.join(keyed_dir, f'{base}-{query_key}.rss')
+    # server side run and ship time per execution, in microseconds
+    server_file = output_path(qf, 'server')
+    keyed_server_file = os.path.join(keyed_dir, f'{base}-{query_key}.server')
+    if os.path.exists(keyed_csv_file) and not args.overwrite:
+        print(f'    up to date, key {metadata_key}/{query_key}')
+        shutil.copyfile(keyed_csv_file, csv_file)
+        for keyed, current in [(keyed_rss_file, rss_file), (keyed_server_file, server_file)]:
+            if os.path.exists(keyed):
+                shutil.copyfile(keyed, current)
+            elif os.path.exists(current):
+                os.remove(current)
+        continue
+
     if args.wait:
         now = time.time()
         then = time.localtime(now + args.wait)
@@ -257,25 +549,93 @@ for qf in queries:
         print(f"SLEEP {args.wait:.1f}s until {sleep_till}")
         time.sleep(args.wait)
 
-    print('QUERY', os.path.basename(qf))
-
-    csv_file = output_path(qf, 'csv')
-    if os.path.exists(csv_file) and not args.overwrite:
-        print('    skipping because output file exist')
-        continue
-
     qf_rel = os.path.relpath(qf, start=runner_dir)
-    data = run_runner([qf_rel, args.duration], allow_errors=args.allow_errors)
+    querylog = start_querylog() if args.server_time else None
+    try:
+        data, peak_rss = run_runner([qf_rel, args.duration], allow_errors=args.allow_errors)
+        server_samples = finish_querylog(querylog, query_text) if querylog and data is not None else None
+    finally:
+        if querylog:
+            stop_querylog(querylog)
     if data is not None:
-        with open(csv_file, 'w') as f:
+        with open(keyed_csv_file, 'w') as f:
             f.write(data)
+        shutil.copyfile(keyed_csv_file, csv_file)
+        if peak_rss is not None:
+            with open(keyed_rss_file, 'w') as f:
+                print(peak_rss, file=f)
+            shutil.copyfile(keyed_rss_file, rss_file)
+        if server_samples is not None:
+            with open(keyed_server_file, 'w') as f:
+                for run, ship in server_samples:
+                    print(f'{run},{ship}', file=f)
+            shutil.copyfile(keyed_server_file, server_file)
+            print(f'    {len(server_samples)} server side measurements')
         print(f'    {len(data.splitlines())} measurements')
+        results[base] = data
     else:
         failures.append(os.path.basename(qf))
+        # don't let the summary present results from another key as current
+        for current in [csv_file, rss_file, server_file]:
+            if os.path.exists(current):
+                os.remove(current)
+
+
+def find_keyed_csv(csv_file):
+    """The result for the current metadata key that QUERY.csv is a copy of, if any"""
+    name = os.path.splitext(os.path.basename(csv_file))[0]
+    for keyed_csv_file in glob(os.path.join(keyed_dir, glob_escape(name) + '-*.csv')):
+        if filecmp.cmp(keyed_csv_file, csv_file, shallow=False):
+            return keyed_csv_file
+    return None
+
+
+# The toplevel files of queries that did not run this time may have been
+# copied there under another metadata key. Remove those so the summary only
+# shows results that belong to the current key.
+for csv_file in glob(os.path.join(output_dir, '*.csv')):
+    name = os.path.splitext(os.path.basename(csv_file))[0]
+    keyed_csv_file = find_keyed_csv(csv_file)
+    if keyed_csv_file is None:
+        for extension in ['csv', 'rss', 'server']:
+            stale_file = output_path(csv_file, extension)
+            if os.path.exists(stale_file):
+                os.remove(stale_file)
+    elif name not in keywords:
+        keyed_query_file = os.path.splitext(keyed_csv_file)[0] + '.sql'
+        if os.path.exists(keyed_query_file):
+            keywords[name] = parse_keywords(open(keyed_query_file).read())
+
+
+def query_keyword(name, keyword):
+    """Value of @KEYWORD=n@ in the query file, if any"""
+    return keywords.get(name, {}).get(keyword)
+
+
+def server_stats(name, mean_seconds):
+    """Mean server execution and shipping time and the remaining client time,
+    per query and per row. Empty strings if not measured."""
+    server_file = os.path.join(output_dir, name + '.server')
+    if not os.path.exists(server_file) or not mean_seconds:
+        return ['', '', '', '']
+    samples = numpy.loadtxt(server_file, 'f8', delimiter=',', ndmin=2)
+    if len(samples) == 0:
+        return ['', '', '', '']
+    server_seconds = samples[:, 0].mean() / 1e6
+    ship_seconds = samples[:, 1].mean() / 1e6
+    # with @PARALLEL@ the mean time per query is not the latency of a query
+    if (query_keyword(name, 'PARALLEL') or 1) > 1:
+        return [server_seconds, ship_seconds, '', '']
+    client_seconds = mean_seconds - server_seconds
+    rows = query_keyword(name, 'EXPECTED')
+    client_seconds_per_row = client_seconds / rows if rows else ''
+    return [server_seconds, ship_seconds, client_seconds, client_seconds_per_row]
+
 
 # generate a new summary
 with redirect_stdout(io.StringIO()) as summary:
-    print('"name","count","total_seconds","mean_seconds"')
+    print('"name","count","total_seconds","mean_seconds","result_bytes","bytes_per_second","peak_rss_bytes",'
+          '"server_seconds","ship_seconds","client_seconds","client_seconds_per_row"')
     for csv_file in sorted(glob(os.path.join(output_dir, '*.csv'))):
         name = os.path.splitext(os.path.basename(csv_file))[0]
         lines = open(csv_file).readlines()
@@ -290,11 +650,24 @@ with redirect_stdout(io.StringIO()) as summary:
             count = 0
             total_seconds = 0
             mean_seconds = 0
-        print(f'"{name}",{count},{total_seconds},{mean_seconds}')
+        nbytes = query_keyword(name, 'BYTES')
+        bytes_per_second = nbytes * count / total_seconds if nbytes and total_seconds else ''
+        rss_file = os.path.join(output_dir, name + '.rss')
+        peak_rss = open(rss_file).read().strip() if os.path.exists(rss_file) else ''
+        nbytes = nbytes if nbytes is not None else ''
+        server = ','.join(str(x) for x in server_stats(name, mean_seconds))
+        print(f'"{name}",{count},{total_seconds},{mean_seconds},{nbytes},{bytes_per_second},{peak_rss},{server}')
 
 with open(output_path('summary.xxx', 'txt'), 'w') as f:
     f.write(summary.getvalue())
 
+if results and not args.no_history:
+    run_id = history.record_run(
+        args.history, run_started, args.runner, output_dir, BENCHMARK_VERSION, git_rev,
+        args.duration, shlex.join(TOOL_ARGS), metadata + environment, results,
+        {name: query_keyword(name, 'PARALLEL') or 1 for name in results})
+    print(f"Recorded as run {run_id} in {args.history}")
+
 
 if failures:
     print()
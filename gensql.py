@@ -11,6 +11,7 @@ NBIGBLOBS = 10_000
 
 SETUP_FILE = 'queries/_setup.sql'
 TALL_FILE = 'queries/tall_%s.sql'
+LARGE_FILE = 'queries/%s.sql'
 
 
 @dataclass
@@ -78,6 +79,46 @@ gen("sec", "i * INTERVAL '1' SECOND", "%s = 42 * INTERVAL '1' SECOND")
 gen("day", "i * INTERVAL '1' DAY", "%s = 42 * INTERVAL '1' DAY")
 
 
+@dataclass
+class LargeDef:
+    """A result set with BLOB or CLOB values that are large compared to the
+    block sizes used by the protocol"""
+    name: str
+    table: str
+    colname: str
+    size: int
+    rows: int
+    columns: int
+
+
+LARGE_DEFINITIONS: List[LargeDef] = []
+
+# Sizes of the single large values, in bytes
+LARGE_SIZES = {
+    '1m': 1024 * 1024,
+    '16m': 16 * 1024 * 1024,
+    '64m': 64 * 1024 * 1024,
+}
+
+# Many medium values that only together exceed the block sizes
+MEDIUM_SIZE = 16 * 1024
+MEDIUM_ROWS = 200
+MEDIUM_COLUMNS = 10
+
+
+def gen_large():
+    for kind in ['blob', 'clob']:
+        for suffix, size in LARGE_SIZES.items():
+            LARGE_DEFINITIONS.append(
+                LargeDef(f"large_{kind}_{suffix}", 'large_objects', f"{kind}_col", size, 1, 1))
+        LARGE_DEFINITIONS.append(
+            LargeDef(f"medium_{kind}", 'medium_objects', f"{kind}_col", MEDIUM_SIZE,
+                     MEDIUM_ROWS, MEDIUM_COLUMNS))
+
+
+gen_large()
+
+
 def write_file(filename: str, new_content: str, overwrite: bool):
     print(f"FILE {filename}")
     try:
@@ -103,6 +144,33 @@ def write_file(filename: str, new_content: str, overwrite: bool):
     return True
 
 
+LARGE_SETUP_TEMPLATE = """\
+CREATE TABLE large_objects AS
+%(large_selects)s;
+
+CREATE TABLE medium_objects AS
+SELECT
+    value AS idx,
+    CAST(repeat('01', %(medium_size)d) AS BLOB) AS blob_col,
+    repeat('x', %(medium_size)d) AS clob_col
+FROM sys.generate_series(0, %(medium_rows)d);
+"""
+
+
+def gen_large_setup() -> List[str]:
+    selects = [
+        f"SELECT {size} AS size, CAST(repeat('01', {size}) AS BLOB) AS blob_col, "
+        f"repeat('x', {size}) AS clob_col"
+        for size in LARGE_SIZES.values()
+    ]
+    code = LARGE_SETUP_TEMPLATE % dict(
+        large_selects="\nUNION ALL\n".join(selects),
+        medium_size=MEDIUM_SIZE,
+        medium_rows=MEDIUM_ROWS,
+    )
+    return code.splitlines(keepends=True)
+
+
 def gen_setup(setup_file) -> str:
     setup_code = open(setup_file).readlines()
     start_line = None
@@ -117,6 +185,10 @@ def gen_setup(setup_file) -> str:
         f"    , {coldef.gensql:<50}  AS {coldef.colname}" + "\n"
         for coldef in COLUMN_DEFINITIONS
     ]
+
+    start_line = setup_code.index('-- BEGIN LARGE OBJECTS\n') + 1
+    end_line = setup_code.index('-- END LARGE OBJECTS\n')
+    setup_code[start_line: end_line] = gen_large_setup()
     return "".join(setup_code)
 
 
@@ -168,6 +240,30 @@ def gen_tall(coldef: ColumnDef) -> str:
     return TALL_TEMPLATE % values
 
 
+LARGE_TEMPLATE = """\
+-- Result set of %(rows)d x %(columns)d %(kind)s values of %(size)d bytes each
+-- @EXPECTED=%(rows)d@ @NULLCOUNT=0@ @HITCOUNT=%(hitcount)d@ @BYTES=%(total)d@
+
+SELECT
+%(select_list)s
+FROM %(table)s%(where_clause)s;
+"""
+
+
+def gen_large_query(largedef: LargeDef) -> str:
+    values = dataclasses.asdict(largedef)
+    values['kind'] = largedef.colname.split('_')[0]
+    values['hitcount'] = largedef.rows * largedef.columns
+    values['total'] = largedef.rows * largedef.columns * largedef.size
+    values['select_list'] = ",\n".join(
+        f"\t{largedef.colname} AS col{i}" for i in range(largedef.columns))
+    if largedef.table == 'large_objects':
+        values['where_clause'] = f"\nWHERE size = {largedef.size}"
+    else:
+        values['where_clause'] = ""
+    return LARGE_TEMPLATE % values
+
+
 
 if __name__ == "__main__":
     ok = True
@@ -182,5 +278,9 @@ if __name__ == "__main__":
         sql = gen_tall(coldef)
         ok &= write_file(TALL_FILE % coldef.typename, sql, overwrite)
 
+    for largedef in LARGE_DEFINITIONS:
+        sql = gen_large_query(largedef)
+        ok &= write_file(LARGE_FILE % largedef.name, sql, overwrite)
+
     if not ok:
         sys.exit(1)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+# Keeps a history of benchmark runs in a SQLite database so we can track
+# performance over many runs. bench.py appends to it after every run,
+# running this script directly lets you query it.
+
+
+import argparse
+import os
+import re
+import sqlite3
+import statistics
+import sys
+from typing import Dict, List, Optional
+
+import numpy
+
+DEFAULT_HISTORY_FILE = 'history.sqlite3'
+
+SCHEMA = """\
+CREATE TABLE IF NOT EXISTS runs(
+    id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    runner TEXT NOT NULL,
+    output_dir TEXT,
+    benchmark_version TEXT,
+    git_rev TEXT,
+    duration REAL,
+    tool_args TEXT,
+    metadata TEXT
+);
+
+CREATE TABLE IF NOT EXISTS run_info(
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (run_id, key)
+);
+
+CREATE TABLE IF NOT EXISTS results(
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    query TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total_seconds REAL,
+    mean_seconds REAL,
+    median_seconds REAL,
+    min_seconds REAL,
+    max_seconds REAL,
+    stddev_seconds REAL,
+    samples BLOB,
+    PRIMARY KEY (run_id, query)
+);
+"""
+
+# Lines of the form 'Key: value' in the runner metadata
+INFO_PATTERN = re.compile(r'^([A-Za-z][^:]*):\s*(.*)$')
+
+
+def open_history(filename: str) -> sqlite3.Connection:
+    # generous timeout because parallel bench.py invocations may write at the same time
+    conn = sqlite3.connect(filename, timeout=60)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def parse_info(metadata: str) -> Dict[str, str]:
+    info = dict()
+    for line in metadata.splitlines():
+        m = INFO_PATTERN.match(line.strip())
+        if m:
+            info[m.group(1).strip()] = m.group(2).strip()
+    return info
+
+
+def parse_samples(csv_data: str) -> numpy.ndarray:
+    """Parse runner output into a sorted array of timestamps in nanoseconds"""
+    timestamps = numpy.array(csv_data.split(), dtype=numpy.int64)
+    # with @PARALLEL@ the workers' output is not interleaved in order
+    timestamps.sort()
+    return timestamps
+
+
+def sample_stats(timestamps: numpy.ndarray, parallel: int = 1) -> Dict[str, Optional[float]]:
+    count = len(timestamps)
+    stats = dict(count=count, total_seconds=0.0, mean_seconds=None, median_seconds=None,
+                 min_seconds=None, max_seconds=None, stddev_seconds=None)
+    if count == 0:
+        return stats
+    total_seconds = timestamps[-1] / 1e9
+    stats['total_seconds'] = float(total_seconds)
+    stats['mean_seconds'] = float(total_seconds / count)
+    # With @PARALLEL@ the differences between consecutive timestamps are gaps
+    # between completions of different workers, not query latencies.
+    if parallel == 1:
+        durations = numpy.diff(timestamps, prepend=0) / 1e9
+        stats['median_seconds'] = float(numpy.median(durations))
+        stats['min_seconds'] = float(durations.min())
+        stats['max_seconds'] = float(durations.max())
+        stats['stddev_seconds'] = float(durations.std())
+    return stats
+
+
+def record_run(filename: str, started: str, runner: str, output_dir: str, benchmark_version: str,
+               git_rev: str, duration: float, tool_args: str, metadata: str,
+               results: Dict[str, str], parallelism: Optional[Dict[str, int]] = None) -> int:
+    """Store the metadata and the raw runner output of one bench.py invocation.
+    STARTED is the time the invocation started, before running any queries.
+    PARALLELISM maps query names to their @PARALLEL@ setting, default 1."""
+    conn = open_history(filename)
+    try:
+        with conn:
+            cursor = conn.execute(
+                """INSERT INTO runs(started, runner, output_dir, benchmark_version,
+                                    git_rev, duration, tool_args, metadata)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (started, runner, output_dir,
+                 benchmark_version, git_rev, duration, tool_args, metadata))
+            run_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO run_info(run_id, key, value) VALUES (?, ?, ?)",
+                [(run_id, k, v) for k, v in parse_info(metadata).items()])
+            for query, csv_data in results.items():
+                timestamps = parse_samples(csv_data)
+                stats = sample_stats(timestamps, (parallelism or {}).get(query, 1))
+                conn.execute(
+                    """INSERT INTO results(run_id, query, count, total_seconds, mean_seconds,
+                                           median_seconds, min_seconds, max_seconds,
+                                           stddev_seconds, samples)
+                       VALUES (:run_id, :query, :count, :total_seconds, :mean_seconds,
+                               :median_seconds, :min_seconds, :max_seconds,
+                               :stddev_seconds, :samples)""",
+                    dict(stats, run_id=run_id, query=query,
+                         samples=timestamps.astype('<i8').tobytes()))
+    finally:
+        conn.close()
+    return run_id
+
+
+def load_samples(conn: sqlite3.Connection, run_id: int, query: str) -> numpy.ndarray:
+    row = conn.execute(
+        "SELECT samples FROM results WHERE run_id = ? AND query = ?",
+        (run_id, query)).fetchone()
+    if row is None or row[0] is None:
+        return numpy.empty((0,), numpy.int64)
+    return numpy.frombuffer(row[0], dtype='<i8')
+
+
+def query_trend(conn: sqlite3.Connection, query: str, runner: Optional[str] = None,
+                info_key: Optional[str] = None, output_dir: Optional[str] = None,
+                matches: Optional[Dict[str, str]] = None) -> Dict[str, List[tuple]]:
+    """Return the series (run_id, started, runner, git_rev, info, count, queries_per_second),
+    oldest first, for each output directory. Runs in different output directories
+    benchmark different targets and must not be compared with each other.
+    MATCHES restricts the runs to those whose metadata has the given values."""
+    sql = """
+        SELECT r.id, r.started, r.runner, r.output_dir, r.git_rev, i.value, s.count, s.total_seconds
+        FROM results AS s
+        JOIN runs AS r ON r.id = s.run_id
+        LEFT OUTER JOIN run_info AS i ON i.run_id = r.id AND i.key = ?
+        WHERE s.query = ?
+    """
+    params = [info_key, query]
+    if runner:
+        sql += " AND r.runner = ?"
+        params.append(runner)
+    if output_dir:
+        sql += " AND r.output_dir = ?"
+        params.append(os.path.abspath(output_dir))
+    for key, value in (matches or {}).items():
+        sql += " AND EXISTS (SELECT 1 FROM run_info AS m WHERE m.run_id = r.id AND m.key = ? AND m.value = ?)"
+        params += [key, value]
+    sql += " ORDER BY r.output_dir, r.started, r.id"
+    trends = dict()
+    for run_id, started, run_runner, run_output_dir, git_rev, info, count, total in conn.execute(sql, params):
+        qps = count / total if total else None
+        trends.setdefault(run_output_dir, []).append((run_id, started, run_runner, git_rev, info, count, qps))
+    return trends
+
+
+def find_regression(trend: List[tuple], threshold: float, window: int) -> Optional[int]:
+    """Index of the first run that is slower than the median of the preceding
+    WINDOW runs by more than THRESHOLD (a fraction), or None"""
+    for n in range(1, len(trend)):
+        qps = trend[n][-1]
+        previous = [t[-1] for t in trend[max(0, n - window):n] if t[-1] is not None]
+        if qps is None or not previous:
+            continue
+        baseline = statistics.median(previous)
+        if qps < (1.0 - threshold) * baseline:
+            return n
+    return None
+
+
+def print_trend(trend: List[tuple], info_key: Optional[str], marker: Optional[int] = None):
+    header = f'{"run":>5}  {"started":19}  {"runner":24}  {"git revision":24}'
+    if info_key:
+        header += f'  {info_key:24}'
+    header += f'  {"count":>9}  {"queries/s":>12}'
+    print(header)
+    for n, (run_id, started, runner, git_rev, info, count, qps) in enumerate(trend):
+        line = f'{run_id:>5}  {started:19}  {runner:24}  {git_rev or "":24}'
+        if info_key:
+            line += f'  {info or "":24}'
+        qps_text = f'{qps:.2f}' if qps is not None else '-'
+        line += f'  {count:>9}  {qps_text:>12}'
+        if n == marker:
+            line += '  <-- REGRESSION'
+        print(line)
+
+
+argparser = argparse.ArgumentParser(description='Query the benchmark history')
+argparser.add_argument('--history', default=os.path.join(os.path.dirname(sys.argv[0]) or '.', DEFAULT_HISTORY_FILE),
+                       help='SQLite file holding the history')
+subparsers = argparser.add_subparsers(dest='command', required=True)
+
+subparsers.add_parser('runs', help='List the recorded runs')
+
+
+def key_value(text):
+    key, sep, value = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected KEY=VALUE, not {text!r}")
+    return key.strip(), value.strip()
+
+
+# Options shared by 'trend' and 'regression'
+series_parser = argparse.ArgumentParser(add_help=False)
+series_parser.add_argument('query', help='Query name, for example tall_int')
+series_parser.add_argument('-r', '--runner', help='Only consider runs of this runner')
+series_parser.add_argument('-o', '--output-dir', help='Only consider runs with this output directory')
+series_parser.add_argument('-m', '--match', type=key_value, action='append', default=[],
+                           help='Only consider runs whose metadata has KEY=VALUE, for example "DB URL=..."')
+series_parser.add_argument('-k', '--key', default='MonetDB version',
+                           help='Runner metadata key to show alongside, for example "pymonetdb version"')
+
+subparsers.add_parser('trend', parents=[series_parser],
+                      help='Show throughput of a query over time, per output directory')
+
+regression_parser = subparsers.add_parser('regression', parents=[series_parser],
+                                          help='Find the run where a query became slower, per output directory')
+regression_parser.add_argument('--threshold', type=float, default=0.10,
+                               help='Relative slowdown that counts as a regression, default 0.10')
+regression_parser.add_argument('--window', type=int, default=5,
+                               help='Number of preceding runs to compare against, default 5')
+
+
+def main(args):
+    if not os.path.exists(args.history):
+        sys.exit(f"History file {args.history} does not exist")
+    conn = open_history(args.history)
+
+    if args.command == 'runs':
+        sql = """
+            SELECT r.id, r.started, r.runner, r.git_rev, COUNT(s.query)
+            FROM runs AS r LEFT OUTER JOIN results AS s ON s.run_id = r.id
+            GROUP BY r.id, r.started, r.runner, r.git_rev
+            ORDER BY r.started, r.id
+        """
+        for run_id, started, runner, git_rev, nqueries in conn.execute(sql):
+            print(f'{run_id:>5}  {started:19}  {runner:24}  {git_rev or "":24}  {nqueries:>3} queries')
+    else:
+        trends = query_trend(conn, args.query, args.runner, args.key, args.output_dir, dict(args.match))
+        regressions = 0
+        for output_dir, trend in trends.items():
+            print(f'OUTPUT DIR {output_dir}')
+            if args.command == 'trend':
+                print_trend(trend, args.key)
+                print()
+                continue
+            idx = find_regression(trend, args.threshold, args.window)
+            print_trend(trend, args.key, idx)
+            if idx is None:
+                print("No regression found")
+            else:
+                regressions += 1
+                before = trend[idx - 1]
+                after = trend[idx]
+                print(f"Regression started between run {before[0]} (git revision {before[3]}) "
+                      f"and run {after[0]} (git revision {after[3]})")
+            print()
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    args = argparser.parse_args()
+    sys.exit(main(args))
@@ -0,0 +1,135 @@
+# Helpers to control and describe the machine the benchmarks run on.
+# Most of this only works on Linux, elsewhere we report 'unknown'.
+
+from glob import glob
+import os
+import platform
+from typing import Dict, List, Optional
+
+# Runners that support it pin their @PARALLEL@ workers to the cpus
+# listed in this environment variable, round robin.
+WORKER_CPUS_VARIABLE = 'BENCH_WORKER_CPUS'
+
+
+def parse_cpu_list(text: str) -> List[int]:
+    """Parse a cpu list such as '2-5,8' as used by taskset and /sys"""
+    cpus = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            lo, hi = part.split('-', 1)
+            cpus.extend(range(int(lo), int(hi) + 1))
+        else:
+            cpus.append(int(part))
+    if not cpus:
+        raise ValueError(f"empty cpu list: {text!r}")
+    return cpus
+
+
+def format_cpu_list(cpus: List[int]) -> str:
+    return ','.join(str(c) for c in cpus)
+
+
+def read_sys_file(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_governors() -> Dict[str, List[int]]:
+    """Map each scaling governor in use to the cpus using it"""
+    governors = dict()
+    pattern = '/sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_governor'
+    for path in sorted(glob(pattern)):
+        governor = read_sys_file(path)
+        if governor is None:
+            continue
+        cpu = int(path.split('/')[-3][3:])
+        governors.setdefault(governor, []).append(cpu)
+    return governors
+
+
+def turbo_state() -> str:
+    no_turbo = read_sys_file('/sys/devices/system/cpu/intel_pstate/no_turbo')
+    if no_turbo is not None:
+        return 'disabled' if no_turbo == '1' else 'enabled'
+    boost = read_sys_file('/sys/devices/system/cpu/cpufreq/boost')
+    if boost is not None:
+        return 'enabled' if boost == '1' else 'disabled'
+    return 'unknown'
+
+
+def cpu_model() -> str:
+    info = read_sys_file('/proc/cpuinfo') or ''
+    for line in info.splitlines():
+        if line.startswith('model name'):
+            return line.split(':', 1)[1].strip()
+    return platform.processor() or 'unknown'
+
+
+def check_environment(cpus: Optional[List[int]]) -> List[str]:
+    """Return warnings about settings that are known to increase variance"""
+    warnings = []
+    for governor, governed_cpus in cpu_governors().items():
+        if governor == 'performance':
+            continue
+        if cpus is not None and not set(cpus) & set(governed_cpus):
+            continue
+        warnings.append(
+            f"cpu frequency governor is '{governor}' on cpus {format_cpu_list(governed_cpus)}, "
+            "consider 'performance'")
+    if turbo_state() == 'enabled':
+        warnings.append("turbo boost is enabled")
+    return warnings
+
+
+def raise_priority(niceness: int) -> Optional[str]:
+    """Set the niceness of this process, inherited by the runners.
+    Returns an error message if not allowed."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, 0, niceness)
+    except (PermissionError, AttributeError) as e:
+        return f"cannot set niceness to {niceness}: {e}"
+    return None
+
+
+def pin_to(cpus: List[int]):
+    """To be used as preexec_fn"""
+    os.sched_setaffinity(0, cpus)
+
+
+def describe_environment(started: str) -> str:
+    """Describe the current state of the host, written to environment.txt"""
+    governors = cpu_governors()
+    if governors:
+        governor_text = '; '.join(f'{g} on {format_cpu_list(cs)}' for g, cs in governors.items())
+    else:
+        governor_text = 'unknown'
+    try:
+        load = ' '.join(f'{x:.2f}' for x in os.getloadavg())
+    except OSError:
+        load = 'unknown'
+    try:
+        nice = str(os.getpriority(os.PRIO_PROCESS, 0))
+    except AttributeError:
+        nice = 'unknown'
+    try:
+        affinity = format_cpu_list(sorted(os.sched_getaffinity(0)))
+    except AttributeError:
+        affinity = 'unknown'
+    return f"""\
+Run started: {started}
+Host: {platform.node()}
+Kernel: {platform.system()} {platform.release()}
+CPU model: {cpu_model()}
+CPU count: {os.cpu_count()}
+CPU frequency governor: {governor_text}
+Turbo boost: {turbo_state()}
+Load average: {load}
+Available cpus: {affinity}
+Niceness: {nice}
+"""
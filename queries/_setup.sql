@@ -2,6 +2,8 @@ START TRANSACTION;
 
 DROP TABLE IF EXISTS tall;
 DROP TABLE IF EXISTS very_tall;
+DROP TABLE IF EXISTS large_objects;
+DROP TABLE IF EXISTS medium_objects;
 
 CREATE TEMPORARY TABLE nums(i INT, idx INT);
 INSERT INTO nums
@@ -85,4 +87,22 @@ INSERT INTO very_tall SELECT * FROM tall;
 INSERT INTO very_tall SELECT * FROM tall;
 INSERT INTO very_tall SELECT * FROM tall;
 
+
+-- Large values, generated by gensql.py
+-- BEGIN LARGE OBJECTS
+CREATE TABLE large_objects AS
+SELECT 1048576 AS size, CAST(repeat('01', 1048576) AS BLOB) AS blob_col, repeat('x', 1048576) AS clob_col
+UNION ALL
+SELECT 16777216 AS size, CAST(repeat('01', 16777216) AS BLOB) AS blob_col, repeat('x', 16777216) AS clob_col
+UNION ALL
+SELECT 67108864 AS size, CAST(repeat('01', 67108864) AS BLOB) AS blob_col, repeat('x', 67108864) AS clob_col;
+
+CREATE TABLE medium_objects AS
+SELECT
+    value AS idx,
+    CAST(repeat('01', 16384) AS BLOB) AS blob_col,
+    repeat('x', 16384) AS clob_col
+FROM sys.generate_series(0, 200);
+-- END LARGE OBJECTS
+
 COMMIT;
@@ -0,0 +1,7 @@
+-- Result set of 1 x 1 blob values of 16777216 bytes each
+-- @EXPECTED=1@ @NULLCOUNT=0@ @HITCOUNT=1@ @BYTES=16777216@
+
+SELECT
+	blob_col AS col0
+FROM large_objects
+WHERE size = 16777216;
@@ -0,0 +1,7 @@
+-- Result set of 1 x 1 blob values of 67108864 bytes each
+-- @EXPECTED=1@ @NULLCOUNT=0@ @HITCOUNT=1@ @BYTES=67108864@
+
+SELECT
+	blob_col AS col0
+FROM large_objects
+WHERE size = 67108864;
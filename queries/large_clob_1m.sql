@@ -0,0 +1,7 @@
+-- Result set of 1 x 1 clob values of 1048576 bytes each
+-- @EXPECTED=1@ @NULLCOUNT=0@ @HITCOUNT=1@ @BYTES=1048576@
+
+SELECT
+	clob_col AS col0
+FROM large_objects
+WHERE size = 1048576;
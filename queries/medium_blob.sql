@@ -0,0 +1,15 @@
+-- Result set of 200 x 10 blob values of 16384 bytes each
+-- @EXPECTED=200@ @NULLCOUNT=0@ @HITCOUNT=2000@ @BYTES=32768000@
+
+SELECT
+	blob_col AS col0,
+	blob_col AS col1,
+	blob_col AS col2,
+	blob_col AS col3,
+	blob_col AS col4,
+	blob_col AS col5,
+	blob_col AS col6,
+	blob_col AS col7,
+	blob_col AS col8,
+	blob_col AS col9
+FROM medium_objects;
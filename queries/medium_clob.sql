@@ -0,0 +1,15 @@
+-- Result set of 200 x 10 clob values of 16384 bytes each
+-- @EXPECTED=200@ @NULLCOUNT=0@ @HITCOUNT=2000@ @BYTES=32768000@
+
+SELECT
+	clob_col AS col0,
+	clob_col AS col1,
+	clob_col AS col2,
+	clob_col AS col3,
+	clob_col AS col4,
+	clob_col AS col5,
+	clob_col AS col6,
+	clob_col AS col7,
+	clob_col AS col8,
+	clob_col AS col9
+FROM medium_objects;